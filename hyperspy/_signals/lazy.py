@@ -17,7 +17,10 @@
 # along with  HyperSpy.  If not, see <http://www.gnu.org/licenses/>.
 
 import logging
+from collections import deque
 from functools import partial
+import math
+from operator import itemgetter
 import warnings
 
 import numpy as np
@@ -25,7 +28,8 @@
 import dask.delayed as dd
 import dask
 from dask.diagnostics import ProgressBar
-from itertools import product
+from itertools import product, repeat
+from numba import njit
 from packaging.version import Version
 
 from hyperspy.signal import BaseSignal
@@ -45,6 +49,9 @@
 
 lazyerror = NotImplementedError('This method is not available in lazy signals')
 
+# Numerical types that the numba kernels can't be compiled for
+_numba_unsupported_types = (np.float16, np.longdouble, np.clongdouble)
+
 
 def to_array(thing, chunks=None):
     """Accepts BaseSignal, dask or numpy arrays and always produces either
@@ -90,7 +97,8 @@ class LazySignal(BaseSignal):
     """
     _lazy = True
 
-    def compute(self, close_file=False, show_progressbar=None, **kwargs):
+    def compute(self, close_file=False, show_progressbar=None, to_zarr=None,
+                **kwargs):
         """Attempt to store the full signal in memory.
 
         Parameters
@@ -100,6 +108,16 @@ def compute(self, close_file=False, show_progressbar=None, **kwargs):
             array data if any. Note that closing the file will make all other
             associated lazy signals inoperative.
         %s
+        to_zarr : None, str or zarr store, default None
+            If not None, store the computed data in this zarr store (a path
+            or, for example, a :py:class:`zarr.storage.MemoryStore`) instead
+            of in memory. The signal then stays lazy and its data is read
+            from the store, so that data larger than the memory can be
+            computed. Requires the ``zarr`` package.
+        **kwargs : dict
+            Any other keyword arguments for :py:meth:`dask.array.Array.compute`,
+            e.g. ``scheduler`` or ``optimize_graph``. The graph is optimized
+            (including task fusion) by default.
 
         Returns
         -------
@@ -112,16 +130,32 @@ def compute(self, close_file=False, show_progressbar=None, **kwargs):
                 "in HyperSpy 2.0. Use `show_progressbar` instead.",
                 VisibleDeprecationWarning,
             )
-            show_progressbar = kwargs["progressbar"]
+            show_progressbar = kwargs.pop("progressbar")
 
         if show_progressbar is None:
             show_progressbar = preferences.General.show_progressbar
 
         cm = ProgressBar if show_progressbar else dummy_context_manager
 
+        if to_zarr is not None:
+            from numcodecs import Blosc
+            data = self.data
+            if any(len(set(c[:-1])) > 1 or c[-1] > c[0] for c in data.chunks):
+                # zarr requires regular chunks
+                data = data.rechunk(data.chunksize)
+            stored = data.to_zarr(
+                to_zarr, overwrite=True, compute=False,
+                compressor=Blosc(cname='zstd', clevel=3,
+                                 shuffle=Blosc.BITSHUFFLE))
+            with cm():
+                dask.compute(stored, **kwargs)
+            if close_file:
+                self.close_file()
+            self.data = da.from_zarr(to_zarr)
+            return
+
         with cm():
-            da = self.data
-            data = da.compute()
+            data = self.data.compute(**kwargs)
             if close_file:
                 self.close_file()
             self.data = data
@@ -183,11 +217,7 @@ def _get_file_handle(self, warn=True):
         """Return file handle when possible; currently only hdf5 file are
         supported.
         """
-        arrkey = None
-        for key in self.data.dask.keys():
-            if "array-original" in key:
-                arrkey = key
-                break
+        arrkey = self._get_original_array_key()
         if arrkey:
             try:
                 return self.data.dask[arrkey].file
@@ -197,6 +227,51 @@ def _get_file_handle(self, warn=True):
                                     "the file is already closed or it is not "
                                     "an hdf5 file.")
 
+    def _get_data_cache(self):
+        """Return a dictionary to cache metadata of the current dask array.
+
+        The name of a dask array identifies its graph and its chunks, so the
+        cache is emptied whenever the name changes, e.g. after rechunking,
+        changing the dtype or reassigning the data.
+        """
+        name = self.data.name
+        cache = getattr(self, "_data_cache", None)
+        if cache is None or cache[0] != name:
+            cache = (name, {})
+            self._data_cache = cache
+        return cache[1]
+
+    def _get_original_array_key(self):
+        """Return the key of the task holding the array the dask array was
+        created from (e.g. an h5py Dataset) or None if there is none.
+
+        The lookup uses the names of the layers of the high level graph to
+        avoid materializing all the keys of the graph. The result is cached
+        for the current dask array.
+        """
+        cache = self._get_data_cache()
+        if "original_array_key" in cache:
+            return cache["original_array_key"]
+        graph = self.data.__dask_graph__()
+        # The key is named "original-array-*" in recent dask versions and
+        # "array-original-*" in older ones.
+        markers = ("original-array", "array-original")
+        arrkey = None
+        if hasattr(graph, "layers"):
+            for layer_name in graph.layers:
+                if any(marker in layer_name for marker in markers):
+                    arrkey = layer_name
+                    break
+        else:
+            # Older dask versions don't have high level graphs
+            for key in graph.keys():
+                if isinstance(key, str) and any(marker in key
+                                                for marker in markers):
+                    arrkey = key
+                    break
+        cache["original_array_key"] = arrkey
+        return arrkey
+
     def _get_dask_chunks(self, axis=None, dtype=None):
         """Returns dask chunks.
 
@@ -255,28 +330,38 @@ def _get_dask_chunks(self, axis=None, dtype=None):
             if ax not in need_axes
         ]
 
-        while True:
-            if multiply(sizes) <= num_that_fit:
+        # Halve the largest axis until the chunk fits. Each halving at least
+        # halves the total size, so ceil(log2(excess)) halvings is an upper
+        # bound and we can stop as soon as it fits.
+        total = multiply(sizes)
+        excess = max(1, math.ceil(total / num_that_fit))
+        for _ in range(math.ceil(math.log2(excess))):
+            if total <= num_that_fit:
                 break
-
-            i = np.argmax(sizes)
-            sizes[i] = np.floor(sizes[i] / 2)
+            i = sizes.index(max(sizes))
+            total //= sizes[i]
+            sizes[i] //= 2
+            total *= sizes[i]
         chunks = []
-        ndim = len(dc.shape)
-        for i in range(ndim):
+        for i, size in enumerate(dc.shape):
             if i in indices:
-                size = float(dc.shape[i])
-                split_array = np.array_split(
-                    np.arange(size), np.ceil(size / sizes[indices.index(i)]))
-                chunks.append(tuple(len(sp) for sp in split_array))
+                # Same splitting as ``np.array_split``: the first ``rem``
+                # chunks are one element larger than the others.
+                k = math.ceil(size / sizes[indices.index(i)])
+                base, rem = divmod(size, k)
+                chunks.append((base + 1,) * rem + (base,) * (k - rem))
             else:
-                chunks.append((dc.shape[i], ))
+                chunks.append((size, ))
         return tuple(chunks)
 
     def _get_navigation_chunk_size(self):
         nav_axes = self.axes_manager.navigation_indices_in_array
-        nav_chunks = tuple([self.data.chunks[i] for i in sorted(nav_axes)])
-        return nav_chunks
+        cache = self._get_data_cache()
+        key = ("navigation_chunks", nav_axes)
+        if key not in cache:
+            chunks = self.data.chunks
+            cache[key] = tuple([chunks[i] for i in sorted(nav_axes)])
+        return cache[key]
 
     def _make_lazy(self, axis=None, rechunk=False, dtype=None):
         self.data = self._lazy_data(axis=axis, rechunk=rechunk, dtype=dtype)
@@ -294,7 +379,7 @@ def change_dtype(self, dtype, rechunk=True):
         self._make_lazy(rechunk=rechunk, dtype=dtype)
     change_dtype.__doc__ = BaseSignal.change_dtype.__doc__
 
-    def _lazy_data(self, axis=None, rechunk=True, dtype=None):
+    def _lazy_data(self, axis=None, rechunk=True, dtype=None, chunks=None):
         """Return the data as a dask array, rechunked if necessary.
 
         Parameters
@@ -308,9 +393,14 @@ def _lazy_data(self, axis=None, rechunk=True, dtype=None):
             not rechunk at least the data is not a dask array, in which case
             it chunks as if rechunk was `True`. If "dask_auto", rechunk if
             necessary using dask's automatic chunk guessing.
+        chunks: None or tuple of tuples
+            If not None, the chunks to use instead of the ones given by
+            ``axis`` and ``rechunk``.
 
         """
-        if rechunk == "dask_auto":
+        if chunks is not None:
+            new_chunks = chunks
+        elif rechunk == "dask_auto":
             new_chunks = "auto"
         else:
             new_chunks = self._get_dask_chunks(axis=axis, dtype=dtype)
@@ -322,12 +412,19 @@ def _lazy_data(self, axis=None, rechunk=True, dtype=None):
                 res = self.data.rechunk(new_chunks)
                 _logger.info(
                     "Final chunks: %s " % str(res.chunks))
-        else:
-            if isinstance(self.data, np.ma.masked_array):
-                data = np.where(self.data.mask, np.nan, self.data)
+        elif isinstance(self.data, np.ma.masked_array):
+            # Set the masked values to nan lazily to avoid a full copy of the
+            # data in memory
+            res = da.from_array(self.data.data, chunks=new_chunks)
+            mask = da.from_array(np.ma.getmaskarray(self.data),
+                                 chunks=res.chunks)
+            if np.issubdtype(res.dtype, np.inexact):
+                fill_value = np.array(np.nan, dtype=res.dtype)
             else:
-                data = self.data
-            res = da.from_array(data, chunks=new_chunks)
+                fill_value = np.array(np.nan)
+            res = da.where(mask, fill_value, res)
+        else:
+            res = da.from_array(self.data, chunks=new_chunks)
         assert isinstance(res, da.Array)
         return res
 
@@ -387,7 +484,18 @@ def rebin(self, new_shape=None, scale=None,
                     "original signal shape")
         axis = {ax.index_in_array: ax
                 for ax in self.axes_manager._axes}[factors.argmax()]
-        self._make_lazy(axis=axis, rechunk=rechunk)
+        # Rechunk only once, to chunks that are multiples of the rebinning
+        # factors so that ``da.coarsen`` never needs to rechunk again
+        if isinstance(self.data, da.Array) and not rechunk:
+            chunks = self.data.chunks
+        else:
+            chunks = self._get_dask_chunks(axis=axis)
+        chunks = _get_rebin_chunks(chunks, self.data.shape,
+                                   factors.astype(int))
+        if not isinstance(self.data, da.Array):
+            self.data = self._lazy_data(chunks=chunks)
+        elif self.data.chunks != chunks:
+            self.data = self.data.rechunk(chunks)
         return super().rebin(new_shape=new_shape, scale=scale, crop=crop,
                              dtype=dtype, out=out)
     rebin.__doc__ = BaseSignal.rebin.__doc__
@@ -406,27 +514,8 @@ def diff(self, axis, order=1, out=None, rechunk=True):
         )
         arr_axis = self.axes_manager[axis].index_in_array
 
-        def dask_diff(arr, n, axis):
-            # assume arr is da.Array already
-            n = int(n)
-            if n == 0:
-                return arr
-            if n < 0:
-                raise ValueError("order must be positive")
-            nd = len(arr.shape)
-            slice1 = [slice(None)] * nd
-            slice2 = [slice(None)] * nd
-            slice1[axis] = slice(1, None)
-            slice2[axis] = slice(None, -1)
-            slice1 = tuple(slice1)
-            slice2 = tuple(slice2)
-            if n > 1:
-                return dask_diff(arr[slice1] - arr[slice2], n - 1, axis=axis)
-            else:
-                return arr[slice1] - arr[slice2]
-
         current_data = self._lazy_data(axis=axis, rechunk=rechunk)
-        new_data = dask_diff(current_data, order, arr_axis)
+        new_data = da.diff(current_data, n=int(order), axis=arr_axis)
         if not new_data.ndim:
             new_data = new_data.reshape((1, ))
 
@@ -454,12 +543,22 @@ def integrate_simpson(self, axis, out=None):
         from scipy import integrate
         axis = self.axes_manager[axis]
         data = self._lazy_data(axis=axis, rechunk=True)
-        new_data = data.map_blocks(
-            integrate.simps,
-            x=axis.axis,
-            axis=axis.index_in_array,
-            drop_axis=axis.index_in_array,
-            dtype=data.dtype)
+        if axis.size % 2:
+            # With an even number of intervals, Simpson's rule is a weighted
+            # sum of the samples, which avoids the temporary arrays of simps
+            new_data = data.map_blocks(
+                _integrate_with_weights,
+                weights=_simpson_weights(axis.axis),
+                axis=axis.index_in_array,
+                drop_axis=axis.index_in_array,
+                dtype=data.dtype)
+        else:
+            new_data = data.map_blocks(
+                integrate.simps,
+                x=axis.axis,
+                axis=axis.index_in_array,
+                drop_axis=axis.index_in_array,
+                dtype=data.dtype)
         s = out or self._deepcopy_with_new_data(new_data)
         if out:
             if out.data.shape == new_data.shape:
@@ -475,11 +574,20 @@ def integrate_simpson(self, axis, out=None):
 
     integrate_simpson.__doc__ = BaseSignal.integrate_simpson.__doc__
 
+    def _lazy_index2value(self, index, axis):
+        """Lazily convert a dask array of indices of the given axis to
+        values."""
+        axis = self.axes_manager[axis]
+        if axis.is_uniform:
+            return axis.offset + axis.scale * index
+        # Bind the axis values to avoid serialising the signal
+        return index.map_blocks(lambda x, table=axis.axis: table[x],
+                                dtype=axis.axis.dtype)
+
     def valuemax(self, axis, out=None, rechunk=True):
         idx = self.indexmax(axis, rechunk=rechunk)
         old_data = idx.data
-        data = old_data.map_blocks(
-            lambda x: self.axes_manager[axis].index2value(x))
+        data = self._lazy_index2value(old_data, axis)
         if out is None:
             idx.data = data
             return idx
@@ -492,8 +600,7 @@ def valuemax(self, axis, out=None, rechunk=True):
     def valuemin(self, axis, out=None, rechunk=True):
         idx = self.indexmin(axis, rechunk=rechunk)
         old_data = idx.data
-        data = old_data.map_blocks(
-            lambda x: self.axes_manager[axis].index2value(x))
+        data = self._lazy_index2value(old_data, axis)
         if out is None:
             idx.data = data
             return idx
@@ -537,10 +644,21 @@ def get_histogram(self, bins='fd', out=None, rechunk=True, **kwargs):
     @staticmethod
     def _estimate_poissonian_noise_variance(dc, gain_factor, gain_offset,
                                             correlation_factor):
-        variance = (dc * gain_factor + gain_offset) * correlation_factor
-        # The lower bound of the variance is the gaussian noise.
-        variance = da.clip(variance, gain_offset * correlation_factor, np.inf)
-        return variance
+        if (dc.dtype.kind not in "iuf" or
+                dc.dtype.type in _numba_unsupported_types):
+            variance = (dc * gain_factor + gain_offset) * correlation_factor
+            # The lower bound of the variance is the gaussian noise.
+            variance = da.clip(variance, gain_offset * correlation_factor,
+                               np.inf)
+            return variance
+        # Compute the variance and clip it in a single pass over each block
+        # Same dtype as the numpy implementation
+        dtype = BaseSignal._estimate_poissonian_noise_variance(
+            np.empty(0, dtype=dc.dtype), gain_factor, gain_offset,
+            correlation_factor).dtype
+        return dc.map_blocks(_poissonian_noise_variance, gain_factor,
+                             gain_offset, correlation_factor, dtype=dtype,
+                             out_dtype=dtype)
 
     # def _get_navigation_signal(self, data=None, dtype=None):
     # return super()._get_navigation_signal(data=data, dtype=dtype).as_lazy()
@@ -559,14 +677,35 @@ def _calculate_summary_statistics(self, rechunk=True):
             rechunk = "dask_auto"
         data = self._lazy_data(rechunk=rechunk)
         _raveled = data.ravel()
-        _mean, _std, _min, _q1, _q2, _q3, _max = da.compute(
-            da.nanmean(data),
-            da.nanstd(data),
-            da.nanmin(data),
-            da.percentile(_raveled, [25, ]),
-            da.percentile(_raveled, [50, ]),
-            da.percentile(_raveled, [75, ]),
-            da.nanmax(data), )
+        if data.dtype.kind not in "iuf":
+            # The single pass reduction only supports real numbers
+            _mean, _std, _min, _quartiles, _max = da.compute(
+                da.nanmean(data),
+                da.nanstd(data),
+                da.nanmin(data),
+                da.percentile(_raveled, [25, 50, 75]),
+                da.nanmax(data), )
+            _q1, _q2, _q3 = _quartiles
+            return _mean, _std, _min, _q1, _q2, _q3, _max
+        # Count, mean and M2 are calculated in a single pass over the data
+        # and the quartiles with a single percentile call. Min and max are
+        # computed at the same time, sharing the tasks reading the data, and
+        # keep the dtype of the data.
+        _stats = da.reduction(_raveled,
+                              chunk=_summary_statistics_chunk,
+                              combine=_summary_statistics_combine,
+                              aggregate=_summary_statistics_combine,
+                              axis=0,
+                              keepdims=True,
+                              output_size=3,
+                              dtype=np.float64,
+                              concatenate=True)
+        _stats, _min, _max, _quartiles = da.compute(
+            _stats, da.nanmin(data), da.nanmax(data),
+            da.percentile(_raveled, [25, 50, 75]))
+        _count, _mean, _m2 = _stats
+        _std = np.sqrt(_m2 / _count) if _count else np.nan
+        _q1, _q2, _q3 = _quartiles
         return _mean, _std, _min, _q1, _q2, _q3, _max
 
     def _map_all(self, function, inplace=True, **kwargs):
@@ -597,8 +736,9 @@ def _map_iterate(self,
         nav_indexes = self.axes_manager.navigation_indices_in_array
         if ragged and inplace:
             raise ValueError("Ragged and inplace are not compatible with a lazy signal")
-        chunk_span = np.equal(self.data.chunksize, self.data.shape)
-        chunk_span = [chunk_span[i] for i in self.axes_manager.signal_indices_in_array]
+        chunksize, shape = self.data.chunksize, self.data.shape
+        chunk_span = [chunksize[i] == shape[i]
+                      for i in self.axes_manager.signal_indices_in_array]
         if not all(chunk_span):
             _logger.info("The chunk size needs to span the full signal size, rechunking...")
             old_sig = self.rechunk(inplace=False)
@@ -611,68 +751,79 @@ def _map_iterate(self,
 
         for key in iterating_kwargs:
             if not isinstance(iterating_kwargs[key], BaseSignal):
-                iterating_kwargs[key] = BaseSignal(iterating_kwargs[key].T).T
                 warnings.warn(
                     "Passing arrays as keyword arguments can be ambigous. "
                     "This is deprecated and will be removed in HyperSpy 2.0. "
                     "Pass signal instances instead.",
                     VisibleDeprecationWarning)
+                # The array axes are given in the axes_manager order: chunk
+                # its (transposed) view directly instead of building a signal
+                arr = np.asarray(iterating_kwargs[key]).T
+                args += (da.from_array(arr, chunks=nav_chunks), )
+                arg_keys += (key,)
+                continue
             if iterating_kwargs[key]._lazy:
                 if iterating_kwargs[key]._get_navigation_chunk_size() != nav_chunks:
                     iterating_kwargs[key].rechunk(nav_chunks=nav_chunks)
-            else:
-                iterating_kwargs[key] = iterating_kwargs[key].as_lazy()
-                iterating_kwargs[key].rechunk(nav_chunks=nav_chunks)
-            extra_dims = (len(old_sig.axes_manager.signal_shape) -
-                          len(iterating_kwargs[key].axes_manager.signal_shape))
-            if extra_dims > 0:
-                old_shape = iterating_kwargs[key].data.shape
-                new_shape = old_shape + (1,)*extra_dims
-                args += (iterating_kwargs[key].data.reshape(new_shape), )
-            else:
                 args += (iterating_kwargs[key].data, )
+            else:
+                # Chunk the data directly with the navigation chunks of the
+                # signal instead of converting with `as_lazy` and rechunking
+                kwarg = iterating_kwargs[key]
+                sig_chunks = (-1,) * kwarg.axes_manager.signal_dimension
+                args += (da.from_array(kwarg.data,
+                                       chunks=nav_chunks + sig_chunks), )
             arg_keys += (key,)
 
         if autodetermine: #trying to guess the output d-type and size from one signal
-            testing_kwargs = {}
-            for key in iterating_kwargs:
-                test_ind = (0,) * len(old_sig.axes_manager.navigation_axes)
-                testing_kwargs[key] = np.squeeze(iterating_kwargs[key].inav[test_ind].data).compute()
-            testing_kwargs = {**kwargs, **testing_kwargs}
-            test_data = np.array(old_sig.inav[(0,) * len(old_sig.axes_manager.navigation_shape)].data.compute())
+            test_ind = (0,) * len(old_sig.axes_manager.navigation_axes)
+            # compute all the test values at once to avoid a scheduler
+            # round-trip per iterating kwarg
+            test_data, *test_values = dask.compute(
+                old_sig.inav[test_ind].data,
+                *[arg[test_ind].squeeze() for arg in args],
+                scheduler="synchronous")
+            testing_kwargs = {**kwargs, **dict(zip(arg_keys, test_values))}
             output_signal_size, output_dtype = guess_output_signal_size(test_signal=test_data,
                                                                         function=function,
                                                                         ragged=ragged,
                                                                         **testing_kwargs)
-        # Dropping/Adding Axes
-        if output_signal_size == old_sig.axes_manager.signal_shape:
-            drop_axis = None
-            new_axis = None
-            axes_changed = False
-        else:
-            axes_changed = True
-            if len(output_signal_size) != len(old_sig.axes_manager.signal_shape):
-                drop_axis = old_sig.axes_manager.signal_indices_in_array
-                new_axis = tuple(range(len(nav_indexes), len(nav_indexes) + len(output_signal_size)))
-            else:
-                drop_axis = [it for (o, i, it) in zip(output_signal_size,
-                                                      old_sig.axes_manager.signal_shape,
-                                                      old_sig.axes_manager.signal_indices_in_array)
-                             if o != i]
-                new_axis = drop_axis
-        chunks = tuple([old_sig.data.chunks[i] for i in sorted(nav_indexes)]) + output_signal_size
-        mapped = da.map_blocks(process_function_blockwise,
-                               old_sig.data,
-                               *args,
-                               function=function,
-                               nav_indexes=nav_indexes,
-                               drop_axis=drop_axis,
-                               new_axis=new_axis,
-                               output_signal_size=output_signal_size,
-                               dtype=output_dtype,
-                               chunks=chunks,
-                               arg_keys=arg_keys,
-                               **kwargs)
+        axes_changed = output_signal_size != old_sig.axes_manager.signal_shape
+        # The navigation axes of the signal and of the iterating kwargs are
+        # aligned. All the other axes are contracted: they are not split in
+        # chunks and the output signal axes are new axes.
+        nav_ind = tuple(sorted(nav_indexes))
+        out_ind = nav_ind + tuple(
+            range(old_sig.data.ndim, old_sig.data.ndim + len(output_signal_size)))
+        new_axes = dict(zip(out_ind[len(nav_ind):], output_signal_size))
+        free_ind = old_sig.data.ndim + len(output_signal_size)
+        blockwise_args = [old_sig.data, tuple(range(old_sig.data.ndim))]
+        for arg in args:
+            n_free = arg.ndim - len(nav_ind)
+            blockwise_args += [
+                arg, nav_ind + tuple(range(free_ind, free_ind + n_free))]
+            free_ind += n_free
+        # Bind the arguments that are the same for all blocks once. This also
+        # prevents the keyword arguments of `function` from being interpreted
+        # by `blockwise` (e.g. `name` or `token`).
+        process_function = partial(process_function_blockwise,
+                                   function=function,
+                                   nav_indexes=nav_indexes,
+                                   output_signal_size=output_signal_size,
+                                   output_dtype=output_dtype,
+                                   arg_keys=arg_keys,
+                                   **kwargs)
+        # The iterating kwargs have the same navigation chunks as the signal,
+        # so each task only depends on the matching block of every array and
+        # the distributed scheduler runs it where most of its input lives.
+        mapped = da.blockwise(process_function,
+                              out_ind,
+                              *blockwise_args,
+                              new_axes=new_axes,
+                              concatenate=True,
+                              dtype=output_dtype,
+                              meta=np.empty((0,) * len(out_ind),
+                                            dtype=output_dtype))
         if inplace:
             self.data = mapped
             sig = self
@@ -703,7 +854,8 @@ def _block_iterator(self,
                         flat_signal=True,
                         get=dask.threaded.get,
                         navigation_mask=None,
-                        signal_mask=None):
+                        signal_mask=None,
+                        prefetch=0):
         """A function that allows iterating lazy signal data by blocks,
         defining the dask.Array.
 
@@ -724,20 +876,27 @@ def _block_iterator(self,
         signal_mask : {BaseSignal, numpy array, dask array}
             The signal locations marked as True are not returned (flat) or set
             to NaN or 0.
+        prefetch : int
+            The number of blocks computed in background threads ahead of the
+            block being returned. If 0, the blocks are computed when they
+            are requested.
 
         """
         self._make_lazy()
         data = self._data_aligned_with_axes
         nav_chunks = data.chunks[:self.axes_manager.navigation_dimension]
-        indices = product(*[range(len(c)) for c in nav_chunks])
         signalsize = self.axes_manager.signal_size
         sig_reshape = (signalsize,) if signalsize else ()
         data = data.reshape((self.axes_manager.navigation_shape[::-1] +
                              sig_reshape))
+        if signalsize and len(data.chunks[-1]) > 1:
+            # one block per navigation block, to match the navigation mask
+            data = data.rechunk({-1: -1})
 
+        # Without masks, None is passed to `_apply_masks` instead of building
+        # all-False masks
         if signal_mask is None:
-            signal_mask = slice(None) if flat_signal else \
-                np.zeros(self.axes_manager.signal_size, dtype='bool')
+            signal_mask = slice(None) if flat_signal else None
         else:
             try:
                 signal_mask = to_array(signal_mask).ravel()
@@ -750,10 +909,7 @@ def _block_iterator(self,
                 signal_mask = ~signal_mask
 
         if navigation_mask is None:
-            nav_mask = da.zeros(
-                self.axes_manager.navigation_shape[::-1],
-                chunks=nav_chunks,
-                dtype='bool')
+            nav_masks = repeat(None)
         else:
             try:
                 nav_mask = to_array(navigation_mask, chunks=nav_chunks)
@@ -762,21 +918,39 @@ def _block_iterator(self,
                 raise ValueError("navigation_mask has to be a signal, numpy or"
                                  " dask array, but "
                                  "{} was given".format(type(navigation_mask)))
-        if flat_signal:
-            nav_mask = ~nav_mask
-        for ind in indices:
-            chunk = get(data.dask,
-                        (data.name, ) + ind + (0,) * bool(signalsize))
-            n_mask = get(nav_mask.dask, (nav_mask.name, ) + ind)
             if flat_signal:
-                yield chunk[n_mask, ...][..., signal_mask]
-            else:
-                chunk = chunk.copy()
-                value = np.nan if np.can_cast('float', chunk.dtype) else 0
-                chunk[n_mask, ...] = value
-                chunk[..., signal_mask] = value
-                yield chunk.reshape(chunk.shape[:-1] +
-                                    self.axes_manager.signal_shape[::-1])
+                nav_mask = ~nav_mask
+            nav_masks = nav_mask.to_delayed().ravel()
+        # The graphs are optimized once for all the blocks and the masks are
+        # applied to each block in the same task that loads it
+        apply_masks = dask.delayed(partial(
+            _apply_masks,
+            signal_mask=signal_mask,
+            flat_signal=flat_signal,
+            signal_shape=self.axes_manager.signal_shape[::-1]),
+            pure=True)
+        tasks = (apply_masks(chunk, n_mask) for chunk, n_mask in
+                 zip(data.to_delayed().ravel(), nav_masks))
+        if not prefetch:
+            for task in tasks:
+                yield task.compute(scheduler=get)
+            return
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=prefetch) as executor:
+            futures = deque()
+            try:
+                for task in tasks:
+                    futures.append(executor.submit(task.compute, scheduler=get))
+                    if len(futures) > prefetch:
+                        yield futures.popleft().result()
+                while futures:
+                    yield futures.popleft().result()
+            finally:
+                # Don't compute the remaining blocks if the iteration stops
+                for future in futures:
+                    future.cancel()
 
     def decomposition(
         self,
@@ -789,6 +963,9 @@ def decomposition(
         num_chunks=None,
         reproject=True,
         print_info=True,
+        prefetch=2,
+        low_precision=False,
+        persist=None,
         **kwargs
     ):
         """Perform Incremental (Batch) decomposition on the data.
@@ -806,7 +983,11 @@ def decomposition(
             The decomposition algorithm to use.
         output_dimension : int or None, default None
             Number of components to keep/calculate. If None, keep all
-            (only valid for 'SVD' algorithm)
+            (only valid for 'SVD' algorithm). For the 'SVD' algorithm, the
+            components are calculated with the randomized
+            :py:func:`dask.array.linalg.svd_compressed` when it is given:
+            the results are then approximate and differ between runs,
+            unless ``seed`` is passed to make them reproducible.
         get : dask scheduler
             the dask scheduler to use for computations;
             default `dask.threaded.get`
@@ -826,8 +1007,28 @@ def decomposition(
             If True, print information about the decomposition being performed.
             In the case of sklearn.decomposition objects, this includes the
             values of all arguments of the chosen sklearn algorithm.
+        prefetch : int, default 2
+            The number of data blocks computed in background threads while
+            the online algorithms ('PCA', 'ORPCA' and 'ORNMF') process the
+            current block. If 0, the blocks are computed one at a time.
+        low_precision : bool, default False
+            If True and the data is single precision (float32), the batches
+            are passed as float32 to the 'PCA' algorithm instead of being
+            converted to float64, which halves their memory usage. The
+            batches of the other online algorithms always keep the dtype of
+            the data.
+        persist : bool or None, default None
+            Only used when ``normalize_poissonian_noise`` is True. If True,
+            the data is persisted in memory before being normalized, so that
+            it is read only once, while it is read again by every pass of
+            the decomposition otherwise. If None, the data is persisted if
+            it takes less than half of the available memory, which requires
+            the ``psutil`` package.
         **kwargs
-            passed to the partial_fit/fit functions.
+            passed to the partial_fit/fit functions. For the 'SVD' algorithm
+            with ``output_dimension``, ``n_power_iter`` (default 2) and
+            ``seed`` (default None, random results) are passed to
+            :py:func:`dask.array.linalg.svd_compressed`.
 
         References
         ----------
@@ -839,6 +1040,7 @@ def decomposition(
         --------
         * :py:meth:`~.learn.mva.MVA.decomposition` for non-lazy signals
         * :py:func:`dask.array.linalg.svd`
+        * :py:func:`dask.array.linalg.svd_compressed`
         * :py:class:`sklearn.decomposition.IncrementalPCA`
         * :py:class:`~.learn.rpca.ORPCA`
         * :py:class:`~.learn.ornmf.ORNMF`
@@ -872,12 +1074,13 @@ def decomposition(
         explained_variance = None
         explained_variance_ratio = None
 
+        ndim = self.axes_manager.navigation_dimension
         _al_data = self._data_aligned_with_axes
-        nav_chunks = _al_data.chunks[: self.axes_manager.navigation_dimension]
-        sig_chunks = _al_data.chunks[self.axes_manager.navigation_dimension :]
+        nav_chunks = _al_data.chunks[:ndim]
 
         num_chunks = 1 if num_chunks is None else num_chunks
-        blocksize = np.min([multiply(ar) for ar in product(*nav_chunks)])
+        # The smallest block is made of the smallest chunk of every axis
+        blocksize = multiply([min(c) for c in nav_chunks])
         nblocks = multiply([len(c) for c in nav_chunks])
 
         if output_dimension and blocksize / output_dimension < num_chunks:
@@ -894,12 +1097,22 @@ def decomposition(
         ]
 
         # LEARN
+        # The dtype of the batches passed to ``method``, None to keep the
+        # dtype of the data
+        learn_dtype = None
         if algorithm == "PCA":
             if not import_sklearn.sklearn_installed:
                 raise ImportError("algorithm='PCA' requires scikit-learn")
 
             obj = import_sklearn.sklearn.decomposition.IncrementalPCA(n_components=output_dimension)
-            method = partial(obj.partial_fit, **kwargs)
+            # The batches are concatenated directly as C-contiguous float64
+            # (or float32) arrays, so that sklearn doesn't need to validate
+            # and copy them
+            if low_precision and self.data.dtype == np.float32:
+                learn_dtype = np.float32
+            else:
+                learn_dtype = np.float64
+            method = partial(_partial_fit_finite, obj, **kwargs)
             reproject = True
             to_print.extend(["scikit-learn estimator:", obj])
 
@@ -928,40 +1141,42 @@ def decomposition(
                 _logger.info("Scaling the data to normalize Poissonian noise")
 
                 data = self._data_aligned_with_axes
-                ndim = self.axes_manager.navigation_dimension
-                sdim = self.axes_manager.signal_dimension
-                nm = da.logical_not(
-                    da.zeros(self.axes_manager.navigation_shape[::-1], chunks=nav_chunks)
-                    if navigation_mask is None
-                    else to_array(navigation_mask, chunks=nav_chunks)
+                if persist is None:
+                    available_memory = _available_memory()
+                    persist = (available_memory is not None and
+                               data.nbytes < 0.5 * available_memory)
+                if persist:
+                    # The data is read by the sums and by every pass of the
+                    # decomposition on the normalized data
+                    data = data.persist(scheduler=get)
+                # The elements that are not masked, dask masks are computed
+                # with the scheduler of the decomposition
+                nm, sm = dask.compute(
+                    *[mask.data if isinstance(mask, BaseSignal) else mask
+                      for mask in (navigation_mask, signal_mask)],
+                    scheduler=get)
+                nm = True if nm is None else ~to_array(nm).astype(bool)
+                sm = True if sm is None else ~to_array(sm).astype(bool)
+                bH, aG = _navigation_and_signal_sums(data, ndim, scheduler=get)
+                # The square roots are small (navigation and signal shaped),
+                # the normalization coefficients of each block are computed
+                # from them in the block
+                raG = np.sqrt(np.where(nm, aG, 1))
+                rbH = np.sqrt(np.where(sm, bH, 1))
+                # Used to rescale the results
+                raG_col = raG.reshape((-1, 1))
+                rbH_col = rbH.reshape((-1, 1))
+                self.data = data.map_blocks(
+                    _normalize_poissonian_noise,
+                    raG=raG,
+                    rbH=rbH,
+                    dtype=np.result_type(data.dtype, raG.dtype, rbH.dtype),
                 )
-                sm = da.logical_not(
-                    da.zeros(self.axes_manager.signal_shape[::-1], chunks=sig_chunks)
-                    if signal_mask is None
-                    else to_array(signal_mask, chunks=sig_chunks)
-                )
-                ndim = self.axes_manager.navigation_dimension
-                sdim = self.axes_manager.signal_dimension
-                bH, aG = da.compute(
-                    data.sum(axis=tuple(range(ndim))),
-                    data.sum(axis=tuple(range(ndim, ndim + sdim))),
-                )
-                bH = da.where(sm, bH, 1)
-                aG = da.where(nm, aG, 1)
-
-                raG = da.sqrt(aG)
-                rbH = da.sqrt(bH)
-
-                coeff = raG[(...,) + (None,) * rbH.ndim] * rbH[(None,) * raG.ndim + (...,)]
-                coeff.map_blocks(np.nan_to_num)
-                coeff = da.where(coeff == 0, 1, coeff)
-                data = data / coeff
-                self.data = data
 
             # LEARN
             if algorithm == "SVD":
                 reproject = False
-                from dask.array.linalg import svd
+                from dask.array.linalg import svd, svd_compressed
 
                 try:
                     self._unfolded4decomposition = self.unfold()
@@ -969,16 +1184,20 @@ def decomposition(
                     if navigation_mask is not None or signal_mask is not None:
                         raise NotImplementedError("Masking is not yet implemented for lazy SVD")
 
-                    U, S, V = svd(self.data)
-
                     if output_dimension is None:
+                        U, S, V = svd(self.data)
                         min_shape = min(min(U.shape), min(V.shape))
+                        U = U[:, :min_shape]
+                        S = S[:min_shape]
+                        V = V[:min_shape]
                     else:
-                        min_shape = output_dimension
-
-                    U = U[:, :min_shape]
-                    S = S[:min_shape]
-                    V = V[:min_shape]
+                        # Only compute the requested number of components
+                        U, S, V = svd_compressed(
+                            self.data,
+                            k=output_dimension,
+                            n_power_iter=kwargs.pop("n_power_iter", 2),
+                            seed=kwargs.pop("seed", None),
+                        )
 
                     factors = V.T
                     explained_variance = S ** 2 / self.data.shape[0]
@@ -998,6 +1217,7 @@ def decomposition(
                             get=get,
                             signal_mask=signal_mask,
                             navigation_mask=navigation_mask,
+                            prefetch=prefetch,
                         ),
                         total=nblocks,
                         leave=True,
@@ -1005,11 +1225,11 @@ def decomposition(
                     ):
                         this_data.append(chunk)
                         if len(this_data) == num_chunks:
-                            thedata = np.concatenate(this_data, axis=0)
+                            thedata = _concatenate_blocks(this_data, learn_dtype)
                             method(thedata)
                             this_data = []
                     if len(this_data):
-                        thedata = np.concatenate(this_data, axis=0)
+                        thedata = _concatenate_blocks(this_data, learn_dtype)
                         method(thedata)
                 except KeyboardInterrupt:  # pragma: no cover
                     pass
@@ -1032,48 +1252,57 @@ def decomposition(
             if reproject:
                 if algorithm == "PCA":
                     method = obj.transform
+                elif algorithm in ["ORPCA", "ORNMF"]:
+                    # The projections are (output_dimension, n_samples)
+                    def method(thing):
+                        return obj.project(thing).T
 
-                    def post(a):
-                        return np.concatenate(a, axis=0)
-
-                elif algorithm == "ORPCA":
-                    method = obj.project
-
-                    def post(a):
-                        return np.concatenate(a, axis=1).T
-
-                elif algorithm == "ORNMF":
-                    method = obj.project
-
-                    def post(a):
-                        return np.concatenate(a, axis=1).T
+                if navigation_mask is None:
+                    nav_size = multiply(self.axes_manager.navigation_shape)
+                else:
+                    nav_size = int(np.count_nonzero(
+                        ~to_array(navigation_mask).astype(bool)))
 
                 _map = map(
-                    lambda thing: method(thing),
+                    method,
                     self._block_iterator(
                         flat_signal=True,
                         get=get,
                         signal_mask=signal_mask,
                         navigation_mask=navigation_mask,
+                        prefetch=prefetch,
                     ),
                 )
-                H = []
+                # Copy the projected blocks directly into C-contiguous
+                # loadings, so that reshuffling them doesn't need to copy
+                H = None
+                position = 0
                 try:
                     for thing in progressbar(_map, total=nblocks, desc="Project"):
-                        H.append(thing)
+                        if H is None:
+                            H = np.empty((nav_size, thing.shape[1]),
+                                         dtype=thing.dtype)
+                        H[position:position + thing.shape[0]] = thing
+                        position += thing.shape[0]
                 except KeyboardInterrupt:  # pragma: no cover
                     pass
-                loadings = post(H)
+                if H is None:  # pragma: no cover
+                    # Interrupted before the first block was projected
+                    H = np.empty((0, output_dimension), dtype=factors.dtype)
+                loadings = H[:position]
 
             if explained_variance is not None and explained_variance_ratio is None:
                 explained_variance_ratio = explained_variance / explained_variance.sum()
 
             # RESHUFFLE "blocked" LOADINGS
-            ndim = self.axes_manager.navigation_dimension
             if algorithm != "SVD":  # Only needed for online algorithms
                 try:
+                    # Without reprojection, the loadings of ORPCA/ORNMF are a
+                    # transposed view: copy them once to avoid copies in the
+                    # reshapes
                     loadings = _reshuffle_mixed_blocks(
-                        loadings, ndim, (output_dimension,), nav_chunks
+                        np.ascontiguousarray(loadings), ndim,
+                        (output_dimension,), nav_chunks
                     ).reshape((-1, output_dimension))
                 except ValueError:
                     # In case the projection step was not finished, it's left
@@ -1094,8 +1323,8 @@ def post(a):
 
         # Rescale the results if the noise was normalized
         if normalize_poissonian_noise is True:
-            target.factors = target.factors * rbH.ravel()[:, np.newaxis]
-            target.loadings = target.loadings * raG.ravel()[:, np.newaxis]
+            target.factors = target.factors * rbH_col
+            target.loadings = target.loadings * raG_col
 
         # Print details about the decomposition we just performed
         if print_info:
@@ -1179,13 +1408,17 @@ def compute_navigator(self, index=None, chunks_number=None,
                 )
             # Needs to reverse the chunks list to match dask chunking order
             signal_chunks = list(signal_chunks)[::-1]
-            navigation_chunks = ['auto'] * len(self.axes_manager.navigation_shape)
             if Version(dask.__version__) >= Version("2.30.0"):
                 kwargs = {'balance':True}
             else:
                 kwargs = {}
-            chunks = self.data.rechunk([*navigation_chunks, *signal_chunks],
-                                       **kwargs).chunks
+            # Only the signal chunks are used: get them by rechunking an
+            # empty single chunk array of the signal shape instead of
+            # building the rechunk graph of the whole data
+            signal_chunks = da.empty(signal_shape[::-1], chunks=-1).rechunk(
+                signal_chunks, **kwargs).chunks
+            nav_dim = self.axes_manager.navigation_dimension
+            chunks = self.data.chunks[:nav_dim] + signal_chunks
 
         # Get the slice of the corresponding chunk
         signal_size = len(signal_shape)
@@ -1216,29 +1449,265 @@ def _reshuffle_mixed_blocks(array, ndim, sshape, nav_chunks):
     sshape : tuple of ints
         The shape
     """
-    splits = np.cumsum([multiply(ar)
-                        for ar in product(*nav_chunks)][:-1]).tolist()
-    if splits:
-        all_chunks = [
-            ar.reshape(shape + sshape)
-            for shape, ar in zip(
-                product(*nav_chunks), np.split(array, splits))
-        ]
+    nav_chunks = tuple(tuple(c) for c in nav_chunks)
+    if all(len(c) == 1 for c in nav_chunks):
+        return array
+    nav_shape = tuple(sum(c) for c in nav_chunks)
+    if len(nav_chunks) == 1:
+        # With a single navigation axis, the blocks are already in order
+        return array.reshape(nav_shape + sshape)
+    if all(len(set(c)) == 1 for c in nav_chunks):
+        # All the blocks have the same shape: the block and the intra-block
+        # axes only need to be interleaved
+        shape = (tuple(len(c) for c in nav_chunks) +
+                 tuple(c[0] for c in nav_chunks) + sshape)
+        axes = [i + j * ndim for i in range(ndim) for j in range(2)]
+        axes += list(range(2 * ndim, 2 * ndim + len(sshape)))
+        return array.reshape(shape).transpose(axes).reshape(nav_shape + sshape)
+    out = np.empty(nav_shape + sshape, dtype=array.dtype)
+    offsets = [np.cumsum((0,) + c[:-1]) for c in nav_chunks]
+    start = 0
+    for ind in product(*[range(len(c)) for c in nav_chunks]):
+        shape = tuple(c[i] for c, i in zip(nav_chunks, ind))
+        size = multiply(shape)
+        dst = tuple(slice(o[i], o[i] + n)
+                    for o, i, n in zip(offsets, ind, shape))
+        out[dst] = array[start:start + size].reshape(shape + sshape)
+        start += size
+    return out
+
+
+def _concatenate_blocks(blocks, dtype=None):
+    """Concatenate flat blocks along their first axis.
+
+    If `dtype` is not None, the blocks are cast while concatenating them into
+    a C-contiguous array of this dtype.
+    """
+    if dtype is None:
+        return np.concatenate(blocks, axis=0)
+    out = np.empty((sum(block.shape[0] for block in blocks), ) +
+                   blocks[0].shape[1:], dtype=dtype)
+    return np.concatenate(blocks, axis=0, out=out)
 
-        def split_stack_list(what, step, axis):
-            total = len(what)
-            if total != step:
-                return [
-                    np.concatenate(
-                        what[i:i + step], axis=axis)
-                    for i in range(0, total, step)
-                ]
-            else:
-                return np.concatenate(what, axis=axis)
 
-        for chunks, axis in zip(nav_chunks[::-1], range(ndim - 1, -1, -1)):
-            step = len(chunks)
-            all_chunks = split_stack_list(all_chunks, step, axis)
-        return all_chunks
-    else:
-        return array
+def _partial_fit_finite(obj, X, **kwargs):
+    """Call ``obj.partial_fit`` without the validation of sklearn, except for
+    the check that `X` doesn't contain NaN or infinity.
+    """
+    if not np.isfinite(X).all():
+        raise ValueError(
+            "Input X contains NaN or infinity. {} does not accept missing "
+            "values encoded as NaN natively.".format(type(obj).__name__))
+    return obj.partial_fit(X, check_input=False, **kwargs)
+
+
+def _apply_masks(chunk, n_mask, signal_mask, flat_signal, signal_shape):
+    """Apply the navigation and signal masks to a block of unfolded data.
+
+    If `flat_signal` is True, the masks select the elements to keep and the
+    block is returned with shape (navigation_size, signal_size). Otherwise,
+    the masked elements are set to NaN (or 0 for non-float dtypes) and the
+    signal axes of the block are folded back to `signal_shape`. A mask of
+    None masks nothing.
+    """
+    if flat_signal:
+        # The data has no signal axis when the signal is a scalar
+        chunk = chunk.reshape((-1, ) + chunk.shape[-1:] * bool(signal_shape))
+        if n_mask is None:
+            return chunk[..., signal_mask]
+        if isinstance(signal_mask, slice):
+            return chunk[np.ravel(n_mask)]
+        # Select both masks at once, without an intermediate copy
+        return chunk[np.ix_(np.ravel(n_mask), signal_mask)]
+    if n_mask is None and signal_mask is None:
+        return chunk.reshape(chunk.shape[:-1] + signal_shape).copy()
+    if n_mask is None:
+        n_mask = np.zeros(chunk.shape[:-1], dtype=bool)
+    if signal_mask is None:
+        signal_mask = np.zeros(chunk.shape[-1], dtype=bool)
+    value = np.nan if np.can_cast('float', chunk.dtype) else 0
+    if (chunk.dtype.kind not in "biufc" or
+            chunk.dtype.type in _numba_unsupported_types):
+        chunk = chunk.copy()
+        chunk[n_mask, ...] = value
+        chunk[..., signal_mask] = value
+        return chunk.reshape(chunk.shape[:-1] + signal_shape)
+    # Make sure that native endian is used as required by numba.jit
+    if not chunk.dtype.isnative:
+        chunk = chunk.astype(chunk.dtype.type)
+    src = np.ascontiguousarray(chunk).reshape((-1, chunk.shape[-1]))
+    out = np.empty_like(src)
+    _fill_masked_loop(out, src, np.ravel(n_mask), np.ravel(signal_mask),
+                      chunk.dtype.type(value))
+    return out.reshape(chunk.shape[:-1] + signal_shape)
+
+
+@njit(cache=True)
+def _fill_masked_loop(out, src, n_mask, signal_mask,
+                      fill):  # pragma: no cover
+    for i in range(src.shape[0]):
+        if n_mask[i]:
+            out[i, :] = fill
+        else:
+            for j in range(src.shape[1]):
+                out[i, j] = fill if signal_mask[j] else src[i, j]
+
+
+def _available_memory():
+    """Return the available memory in bytes, or None if it is unknown."""
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.virtual_memory().available
+
+
+def _dual_sum(block, ndim):
+    """Return the sums of `block` over its first `ndim` axes and over its
+    other axes, keeping the summed axes.
+    """
+    return (block.sum(axis=tuple(range(ndim)), keepdims=True),
+            block.sum(axis=tuple(range(ndim, block.ndim)), keepdims=True))
+
+
+def _navigation_and_signal_sums(data, ndim, scheduler=None):
+    """Return the sums of a dask array over its first `ndim` (navigation)
+    axes and over its other (signal) axes, in a single pass over its blocks.
+
+    Both sums of each block are computed in the same task and the partial
+    sums of the blocks are then tree-reduced, as with ``da.sum``.
+
+    Returns
+    -------
+    bH, aG : numpy.ndarray
+        The signal shaped and navigation shaped sums.
+    """
+    dtype = np.zeros(1, dtype=data.dtype).sum().dtype
+    pairs = data.map_blocks(
+        partial(_dual_sum, ndim=ndim), dtype=object,
+        meta=np.empty((0, ) * data.ndim, dtype=object))
+    ones = tuple((1, ) * n for n in data.numblocks)
+    # One partial sum per block, with length 1 along the summed axes
+    partial_bH = pairs.map_blocks(
+        itemgetter(0), chunks=ones[:ndim] + data.chunks[ndim:], dtype=dtype,
+        meta=np.empty((0, ) * data.ndim, dtype=dtype))
+    partial_aG = pairs.map_blocks(
+        itemgetter(1), chunks=data.chunks[:ndim] + ones[ndim:], dtype=dtype,
+        meta=np.empty((0, ) * data.ndim, dtype=dtype))
+    return da.compute(partial_bH.sum(axis=tuple(range(ndim))),
+                      partial_aG.sum(axis=tuple(range(ndim, data.ndim))),
+                      scheduler=scheduler)
+
+
+def _normalize_poissonian_noise(block, raG, rbH, block_info=None):
+    """Divide a block of data by the outer product of the square roots of
+    the navigation (`raG`) and signal (`rbH`) sums at its location.
+    """
+    location = block_info[0]["array-location"]
+    raG = raG[tuple(slice(*loc) for loc in location[:raG.ndim])]
+    rbH = rbH[tuple(slice(*loc) for loc in location[raG.ndim:])]
+    # The elements with a zero or NaN coefficient are left unchanged
+    valid = np.multiply.outer(~np.isnan(raG) & (raG != 0),
+                              ~np.isnan(rbH) & (rbH != 0))
+    out = block.astype(block_info[None]["dtype"], copy=True)
+    np.divide(out, np.multiply.outer(raG, rbH), out=out, where=valid)
+    return out
+
+
+def _get_rebin_chunks(chunks, shape, factors):
+    """Return chunks whose lengths are a multiple of the rebinning factors.
+
+    Parameters
+    ----------
+    chunks : tuple of tuples
+        The starting chunks, e.g. the current chunks of the data.
+    shape : tuple of int
+        The shape of the data.
+    factors : array of int
+        The rebinning factors in array order. They must be divisors of
+        ``shape``.
+
+    Returns
+    -------
+    Tuple of tuples, dask chunks
+    """
+    new_chunks = []
+    for chunk, size, factor in zip(chunks, shape, factors):
+        if factor > 1 and any(c % factor for c in chunk):
+            length = max(factor, max(chunk) // factor * factor)
+            n, remainder = divmod(size, length)
+            chunk = (length,) * n + ((remainder,) if remainder else ())
+        new_chunks.append(tuple(chunk))
+    return tuple(new_chunks)
+
+
+def _simpson_weights(x):
+    """Returns the weights of the composite Simpson's rule for samples at
+    ``x``, as used by :py:func:`scipy.integrate.simps`.
+
+    Only valid for an odd number of samples, i.e. an even number of
+    intervals.
+    """
+    h = np.diff(x)
+    h0, h1 = h[0::2], h[1::2]
+    hsum = h0 + h1
+    weights = np.zeros(x.size)
+    weights[:-1:2] += hsum / 6 * (2 - h1 / h0)
+    weights[1::2] += hsum / 6 * hsum ** 2 / (h0 * h1)
+    weights[2::2] += hsum / 6 * (2 - h0 / h1)
+    return weights
+
+
+def _integrate_with_weights(data, weights, axis):
+    """Returns the sum of ``data`` along ``axis`` weighted by ``weights``."""
+    return np.moveaxis(data, axis, -1) @ weights
+
+
+def _summary_statistics_chunk(x, axis=None, keepdims=None):
+    """Returns the count, mean and sum of squared deviations from the mean
+    (M2) of the non-nan values of a block of real data.
+    """
+    x = x[~np.isnan(x)]
+    if not x.size:
+        return np.array([0., 0., 0.])
+    mean = x.mean(dtype=np.float64)
+    m2 = ((x - mean) ** 2).sum(dtype=np.float64)
+    return np.array([x.size, mean, m2], dtype=np.float64)
+
+
+def _summary_statistics_combine(x, axis=None, keepdims=None):
+    """Combines the concatenated outputs of :py:func:`_summary_statistics_chunk`
+    using the pairwise algorithm of Chan et al. for the variance.
+    """
+    count, mean, m2 = x.reshape((-1, 3)).T
+    total = count.sum()
+    if not total:
+        return np.array([0., 0., 0.])
+    new_mean = (count * mean).sum() / total
+    new_m2 = (m2 + count * (mean - new_mean) ** 2).sum()
+    return np.array([total, new_mean, new_m2])
+
+
+def _poissonian_noise_variance(data, gain_factor, gain_offset,
+                               correlation_factor, out_dtype):
+    """Returns ``(data * gain_factor + gain_offset) * correlation_factor``
+    clipped below at ``gain_offset * correlation_factor``.
+    """
+    # Make sure that native endian is used as required by numba.jit
+    if not data.dtype.isnative:
+        data = data.astype(data.dtype.type)
+    data = np.ascontiguousarray(data)
+    out = np.empty(data.shape, dtype=out_dtype)
+    _poissonian_noise_variance_loop(data.ravel(), out.ravel(), gain_factor,
+                                    gain_offset, correlation_factor)
+    return out
+
+
+@njit(cache=True)
+def _poissonian_noise_variance_loop(data, out, gain_factor, gain_offset,
+                                    correlation_factor):  # pragma: no cover
+    # The lower bound of the variance is the gaussian noise.
+    lower_bound = gain_offset * correlation_factor
+    for i in range(data.size):
+        value = (data[i] * gain_factor + gain_offset) * correlation_factor
+        out[i] = lower_bound if value < lower_bound else value
@@ -181,16 +181,19 @@ def histogram_dask(a, bins="fd", max_num_bins=250, **kwargs):
             bins = new_bins
 
     _old_bins = bins
+    # The range of the data, if it has been computed already
+    _range = None
 
     if isinstance(bins, str):
         if bins == "scott":
-            _, bins = _scott_bw_dask(a, True)
+            _, bins, _range = _scott_bw_dask(a, True, return_range=True)
         elif bins == "fd":
-            _, bins = _freedman_bw_dask(a, True)
+            _, bins, _range = _freedman_bw_dask(a, True, return_range=True)
         else:
             raise ValueError(f"Unrecognized 'bins' argument: got {bins}")
     elif not np.iterable(bins):
-        kwargs["range"] = da.compute(a.min(), a.max())
+        _range = da.compute(a.min(), a.max())
+        kwargs["range"] = _range
 
     _bins_len = bins if not np.iterable(bins) else len(bins)
 
@@ -208,7 +211,9 @@ def histogram_dask(a, bins="fd", max_num_bins=250, **kwargs):
             "`max_num_bins` keyword argument."
         )
         bins = max_num_bins
-        kwargs["range"] = da.compute(a.min(), a.max())
+        if _range is None:
+            _range = da.compute(a.min(), a.max())
+        kwargs["range"] = _range
 
     h, bins = da.histogram(a, bins=bins, **kwargs)
 
@@ -218,7 +223,7 @@ def histogram_dask(a, bins="fd", max_num_bins=250, **kwargs):
 histogram_dask.__doc__ %= HISTOGRAM_MAX_BIN_ARGS
 
 
-def _scott_bw_dask(data, return_bins=True):
+def _scott_bw_dask(data, return_bins=True, return_range=False):
     r"""Dask version of scotts_bin_width
 
     Parameters
@@ -227,6 +232,9 @@ def _scott_bw_dask(data, return_bins=True):
         the data
     return_bins : bool (optional)
         if True, then return the bin edges
+    return_range : bool (optional)
+        if True, then return the minimum and maximum of the data, which are
+        computed together with the bin width
 
     Returns
     -------
@@ -234,6 +242,8 @@ def _scott_bw_dask(data, return_bins=True):
         optimal bin width using Scott's rule
     bins : ndarray
         bin edges: returned if `return_bins` is True
+    range : tuple of float
+        (min, max) of the data: returned if `return_range` is True
 
     Notes
     -----
@@ -258,15 +268,16 @@ def _scott_bw_dask(data, return_bins=True):
     dx = 3.5 * sigma * n ** (-1.0 / 3.0)
     c_dx, mx, mn = da.compute(dx, data.max(), data.min())
 
+    out = (c_dx,)
     if return_bins:
         Nbins = max(1, np.ceil((mx - mn) / c_dx))
-        bins = mn + c_dx * np.arange(Nbins + 1)
-        return c_dx, bins
-    else:
-        return c_dx
+        out += (mn + c_dx * np.arange(Nbins + 1),)
+    if return_range:
+        out += ((mn, mx),)
+    return out if len(out) > 1 else c_dx
 
 
-def _freedman_bw_dask(data, return_bins=True):
+def _freedman_bw_dask(data, return_bins=True, return_range=False):
     r"""Dask version of freedman_bin_width
 
     Parameters
@@ -275,6 +286,9 @@ def _freedman_bw_dask(data, return_bins=True):
         the data
     return_bins : bool (optional)
         if True, then return the bin edges
+    return_range : bool (optional)
+        if True, then return the minimum and maximum of the data, which are
+        computed together with the bin width
 
     Returns
     -------
@@ -282,6 +296,8 @@ def _freedman_bw_dask(data, return_bins=True):
         optimal bin width using Scott's rule
     bins : ndarray
         bin edges: returned if `return_bins` is True
+    range : tuple of float
+        (min, max) of the data: returned if `return_range` is True
 
     Notes
     -----
@@ -307,9 +323,10 @@ def _freedman_bw_dask(data, return_bins=True):
     dx = 2 * (v75 - v25) * n ** (-1.0 / 3.0)
     c_dx, mx, mn = da.compute(dx, data.max(), data.min())
 
+    out = (c_dx,)
     if return_bins:
         Nbins = max(1, np.ceil((mx - mn) / c_dx))
-        bins = mn + c_dx * np.arange(Nbins + 1)
-        return c_dx, bins
-    else:
-        return c_dx
+        out += (mn + c_dx * np.arange(Nbins + 1),)
+    if return_range:
+        out += ((mn, mx),)
+    return out if len(out) > 1 else c_dx
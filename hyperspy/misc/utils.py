@@ -17,6 +17,8 @@
 # along with  HyperSpy.  If not, see <http://www.gnu.org/licenses/>.
 
 from operator import attrgetter
+import functools
+import operator
 import warnings
 import inspect
 import copy
@@ -1191,13 +1193,14 @@ def process_function_blockwise(data,
                                function,
                                nav_indexes=None,
                                output_signal_size=None,
+                               output_dtype=None,
                                block_info=None,
                                arg_keys=None,
                                **kwargs):
     """
     Convenience function for processing a function blockwise. By design, its
-    output is used as an argument of the dask ``map_blocks`` so that the
-    function only gets applied to the signal axes.
+    output is used as an argument of the dask ``map_blocks`` or ``blockwise``
+    so that the function only gets applied to the signal axes.
 
     Parameters
     ----------
@@ -1212,6 +1215,9 @@ def process_function_blockwise(data,
         The indexes of the navigation axes for the dataset.
     output_signal_shape: tuple
         The shape of the output signal. For a ragged signal, this is equal to 1
+    output_dtype : {np.dtype, None}
+        The dtype of the output. If None, it is taken from ``block_info``,
+        which is only provided by ``dask.array.map_blocks``.
     block_info : dict
         The block info as described by the ``dask.array.map_blocks`` function
     arg_keys : tuple
@@ -1223,23 +1229,21 @@ def process_function_blockwise(data,
 
     """
     # Both of these values need to be passed in
-    dtype = block_info[None]["dtype"]
+    dtype = block_info[None]["dtype"] if output_dtype is None else output_dtype
     chunk_nav_shape = tuple([data.shape[i] for i in sorted(nav_indexes)])
     output_shape = chunk_nav_shape + tuple(output_signal_size)
     # Pre-allocating the output array
     output_array = np.empty(output_shape, dtype=dtype)
     if len(args) == 0:
         # There aren't any BaseSignals for iterating
-        for nav_index in np.ndindex(chunk_nav_shape):
-            islice = np.s_[nav_index]
+        for islice in np.ndindex(chunk_nav_shape):
             output_array[islice] = function(data[islice],
                                             **kwargs)
     else:
         # There are BaseSignals which iterate alongside the data
-        for index in np.ndindex(chunk_nav_shape):
-            islice = np.s_[index]
-
-            iter_dict = {key: a[islice].squeeze() for key, a in zip(arg_keys,args)}
+        iter_args = tuple(zip(arg_keys, args))
+        for islice in np.ndindex(chunk_nav_shape):
+            iter_dict = {key: a[islice].squeeze() for key, a in iter_args}
             output_array[islice] = function(data[islice],
                                             **iter_dict,
                                             **kwargs)
@@ -1332,10 +1336,7 @@ def multiply(iterable):
     1
 
     """
-    prod = 1
-    for i in iterable:
-        prod *= i
-    return prod
+    return functools.reduce(operator.mul, iterable, 1)
 
 
 def iterable_not_string(thing):
@@ -428,12 +428,7 @@ def test_load_to_memory():
 
 def test_load_readonly():
     s = hs.load(FILE2, lazy=True)
-    k = next(
-        filter(
-            lambda x: isinstance(x, str) and x.startswith("array-original"),
-            s.data.dask.keys(),
-        )
-    )
+    k = s._get_original_array_key()
     mm = s.data.dask[k]
     assert isinstance(mm, np.memmap)
     assert not mm.flags["WRITEABLE"]
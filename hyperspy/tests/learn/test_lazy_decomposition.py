@@ -105,6 +105,42 @@ def test_pca(self, normalize_poissonian_noise):
             explained_variance_norm[: self.rank].sum(), 1.0, atol=1e-6
         )
 
+    @pytest.mark.skipif(not sklearn_installed, reason="sklearn not installed")
+    def test_pca_persist(self):
+        results = []
+        for persist in [True, False]:
+            self.s.decomposition(
+                output_dimension=3,
+                algorithm="PCA",
+                normalize_poissonian_noise=True,
+                persist=persist,
+            )
+            results.append(self.s.learning_results.loadings)
+        np.testing.assert_allclose(*results)
+
+    @pytest.mark.skipif(not sklearn_installed, reason="sklearn not installed")
+    def test_pca_low_precision(self):
+        self.s.change_dtype("float32")
+        self.s.decomposition(
+            output_dimension=3, algorithm="PCA", low_precision=True
+        )
+        assert self.s.learning_results._object.components_.dtype == np.float32
+        factors = self.s.learning_results.factors
+        loadings = self.s.learning_results.loadings
+        X = loadings @ factors.T
+
+        # Check the low-rank component MSE
+        normX = np.linalg.norm(X - self.X)
+        assert normX < self.tol
+
+    @pytest.mark.skipif(not sklearn_installed, reason="sklearn not installed")
+    def test_pca_nan_error(self):
+        data = self.s.data.compute()
+        data[0, 0, 0] = np.nan
+        s = Signal1D(data).as_lazy()
+        with pytest.raises(ValueError, match="Input X contains NaN"):
+            s.decomposition(output_dimension=3, algorithm="PCA")
+
     @pytest.mark.skipif(not sklearn_installed, reason="sklearn not installed")
     def test_pca_mask(self):
         s = self.s
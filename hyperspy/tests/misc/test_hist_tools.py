@@ -87,6 +87,11 @@ def test_fd_logger_warning(self, caplog):
 
         assert out.data.shape == (250,)
         assert "Capping the number of bins" in caplog.text
+        # The capped bins span the range of the data
+        axis = out.axes_manager[0]
+        np.testing.assert_allclose(axis.offset, np.nanmin(self.s1.data))
+        np.testing.assert_allclose(axis.offset + axis.scale * axis.size,
+                                   np.nanmax(self.s1.data))
 
     def test_int_bins_logger_warning(self, caplog):
         with caplog.at_level(logging.WARNING):
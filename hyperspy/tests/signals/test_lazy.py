@@ -23,7 +23,9 @@
 
 import hyperspy.api as hs
 from hyperspy import _lazy_signals
-from hyperspy._signals.lazy import _reshuffle_mixed_blocks, to_array
+from hyperspy._signals.lazy import (_navigation_and_signal_sums,
+                                    _normalize_poissonian_noise,
+                                    _reshuffle_mixed_blocks, to_array)
 from hyperspy.exceptions import VisibleDeprecationWarning
 
 
@@ -58,6 +60,60 @@ def test_reshuffle(signal, sl):
                                   sig.data.chunks[:ndim])
     np.testing.assert_allclose(ans, sig.data.compute())
 
+
+def test_reshuffle_regular_chunks(signal):
+    signal.rechunk(nav_chunks=(3, 3))
+    array = np.concatenate(list(signal._block_iterator()), axis=0)
+    ans = _reshuffle_mixed_blocks(array, 2, signal.data.shape[2:],
+                                  signal.data.chunks[:2])
+    np.testing.assert_allclose(ans, signal.data.compute())
+
+
+def test_reshuffle_one_navigation_axis():
+    s = _lazy_signals.LazySignal1D(
+        da.from_array(np.arange(10 * 4.).reshape((10, 4)), chunks=(3, 4)))
+    array = np.concatenate(list(s._block_iterator()), axis=0)
+    ans = _reshuffle_mixed_blocks(array, 1, (4,), s.data.chunks[:1])
+    np.testing.assert_allclose(ans, s.data.compute())
+
+
+def test_navigation_and_signal_sums(signal):
+    data = signal.data.compute()
+    bH, aG = _navigation_and_signal_sums(signal.data, 2)
+    np.testing.assert_allclose(bH, data.sum(axis=(0, 1)))
+    np.testing.assert_allclose(aG, data.sum(axis=(2, 3)))
+
+
+def test_navigation_and_signal_sums_single_pass(signal):
+    reads = []
+
+    def read(block):
+        reads.append(block.shape)
+        return block
+
+    data = signal.data.map_blocks(read, meta=np.empty((0, ) * 4))
+    bH, aG = _navigation_and_signal_sums(data, 2, scheduler="synchronous")
+    # each block is read once for both sums
+    assert len(reads) == data.npartitions
+    expected = signal.data.compute()
+    np.testing.assert_allclose(bH, expected.sum(axis=(0, 1)))
+    np.testing.assert_allclose(aG, expected.sum(axis=(2, 3)))
+
+
+def test_normalize_poissonian_noise():
+    data = da.from_array(np.arange(4 * 3 * 2).reshape((4, 3, 2)),
+                         chunks=(2, 3, 1))
+    raG = np.array([[1., 2., 0.], [4., np.nan, 2.], [1., 1., 1.], [2., 2., 2.]])
+    rbH = np.array([2., 0.5])
+    normalized = data.map_blocks(_normalize_poissonian_noise, raG=raG, rbH=rbH,
+                                 dtype=float).compute()
+    coeff = raG[..., None] * rbH
+    valid = np.isfinite(coeff) & (coeff != 0)
+    expected = np.where(valid, data.compute() / np.where(valid, coeff, 1),
+                        data.compute())
+    np.testing.assert_allclose(normalized, expected)
+
+
 nav_mask = np.zeros((6, 9), dtype=bool)
 nav_mask[0, 0] = True
 nav_mask[1, 1] = True
@@ -68,7 +124,7 @@ def test_reshuffle(signal, sl):
 @pytest.mark.parametrize('nm', [None, nav_mask])
 @pytest.mark.parametrize('sm', [None, sig_mask])
 @pytest.mark.parametrize('flat', [True, False])
-@pytest.mark.parametrize('dtype', ['float', 'int'])
+@pytest.mark.parametrize('dtype', ['float', 'int', '>f8', 'float16'])
 def test_blockiter_bothmasks(signal, flat, dtype, nm, sm):
     real_first = get(signal.data.dask, (signal.data.name, 0, 0, 0, 0)).copy()
     real_second = get(signal.data.dask, (signal.data.name, 0, 1, 0, 0)).copy()
@@ -95,7 +151,7 @@ def test_blockiter_bothmasks(signal, flat, dtype, nm, sm):
         real_first = real_first.reshape((2 * 4, -1))[slices1]
         real_second = real_second.reshape((2 * 5, -1))[:, sigslice]
     else:
-        value = np.nan if dtype == 'float' else 0
+        value = np.nan if np.can_cast('float', dtype) else 0
         if nm is not None:
             real_first[nm, ...] = value
         if sm is not None:
@@ -105,6 +161,19 @@ def test_blockiter_bothmasks(signal, flat, dtype, nm, sm):
     np.testing.assert_allclose(second_block, real_second)
 
 
+@pytest.mark.parametrize('prefetch', [1, 3])
+def test_blockiter_prefetch(signal, prefetch):
+    expected = list(signal._block_iterator(flat_signal=False))
+    blocks = list(signal._block_iterator(flat_signal=False, prefetch=prefetch))
+    assert len(blocks) == len(expected) == 6
+    for block, block_expected in zip(blocks, expected):
+        np.testing.assert_array_equal(block, block_expected)
+    # stopping the iteration early cancels the blocks not started yet
+    it = signal._block_iterator(prefetch=prefetch)
+    next(it)
+    it.close()
+
+
 @pytest.mark.parametrize('sig', [_signal(),
                                  _signal().data,
                                  _signal().data.compute()])
@@ -140,6 +209,16 @@ def test_ma_lazify():
     assert np.isnan(ss.data[:, 1]).all()
 
 
+@pytest.mark.parametrize('dtype', ['int16', 'float32', 'complex64'])
+def test_ma_lazify_dtype(dtype):
+    data = np.ma.masked_array(data=np.arange(12, dtype=dtype).reshape(3, 4),
+                              mask=np.arange(12).reshape(3, 4) % 3 == 0)
+    l = hs.signals.Signal1D(data).as_lazy()
+    expected = np.where(data.mask, np.nan, data)
+    assert l.data.dtype == expected.dtype
+    np.testing.assert_array_equal(l.data.compute(), expected)
+
+
 @pytest.mark.parametrize('nav_chunks', ["auto", -1, (3, -1)])
 @pytest.mark.parametrize('sig_chunks', [-1, ("auto", "auto"), 4])
 def test_rechunk(signal, nav_chunks, sig_chunks):
@@ -156,3 +235,129 @@ def test_warning():
     assert sig._lazy == False
     thing = to_array(sig, chunks=None)
     assert isinstance(thing, np.ndarray)
+
+
+def test_get_dask_chunks():
+    s = _lazy_signals.LazySignal1D(da.zeros((200, 301, 1024),
+                                            chunks=(10, 10, 1024)))
+    # 200 * 301 float64 spectra do not fit in 100 MB, so the navigation
+    # axes are halved (largest first) until they do
+    assert s._get_dask_chunks() == ((100, 100),
+                                    (61, 60, 60, 60, 60),
+                                    (1024,))
+    assert s._get_dask_chunks(axis=0) == ((200,), (301,), (128,) * 8)
+
+
+@pytest.mark.parametrize("rechunk", [True, False])
+def test_rebin_chunks(rechunk):
+    data = np.arange(12 * 9 * 8.).reshape((12, 9, 8))
+    s = _lazy_signals.LazySignal1D(da.from_array(data, chunks=(5, 4, 8)))
+    s2 = s.rebin(scale=(3, 2, 2), rechunk=rechunk)
+    # the chunks are multiples of the rebinning factors
+    for chunks, factor in zip(s.data.chunks, (2, 3, 2)):
+        assert all(c % factor == 0 for c in chunks)
+    np.testing.assert_allclose(
+        s2.data.compute(), hs.signals.Signal1D(data).rebin(scale=(3, 2, 2)).data)
+
+
+def test_rebin_numpy_data_single_chunking():
+    data = np.arange(12 * 9 * 8.).reshape((12, 9, 8))
+    s = _lazy_signals.LazySignal1D(data)
+    s2 = s.rebin(scale=(1, 4, 1))
+    # the data is chunked directly with the rebinning chunks
+    assert not any(name.startswith("rechunk") for name in s.data.dask.layers)
+    np.testing.assert_allclose(
+        s2.data.compute(), hs.signals.Signal1D(data).rebin(scale=(1, 4, 1)).data)
+
+
+def test_get_original_array_key(tmp_path):
+    h5py = pytest.importorskip("h5py")
+    with h5py.File(tmp_path / "test.h5", "w") as f:
+        dset = f.create_dataset("data", data=np.arange(20.).reshape(4, 5))
+        s = _lazy_signals.LazySignal1D(da.from_array(dset, chunks=(2, 5)))
+        key = s._get_original_array_key()
+        assert s.data.dask[key] is dset
+        assert s._get_file_handle() == f
+        # the key is cached for the current dask array only
+        assert s._data_cache == (s.data.name, {"original_array_key": key})
+        s.rechunk(nav_chunks=(1,))
+        assert s._get_original_array_key() == key
+        s.data = da.zeros((4, 5))
+        assert s._get_original_array_key() is None
+        assert s._get_file_handle() is None
+
+
+def test_calculate_summary_statistics(signal):
+    data = signal.data.compute()
+    data[0, 0, 0] = np.nan
+    signal.data = da.from_array(data, chunks=signal.data.chunks)
+    s = hs.signals.Signal2D(data)
+    # the quartiles of lazy signals are not calculated ignoring nans
+    _mean, _std, _min, *_, _max = signal._calculate_summary_statistics(
+        rechunk=False)
+    mean, std, min_, *_, max_ = s._calculate_summary_statistics()
+    np.testing.assert_allclose((_mean, _std, _min, _max),
+                               (mean, std, min_, max_))
+    signal.data = signal.data[1:]
+    np.testing.assert_allclose(signal._calculate_summary_statistics(),
+                               s.inav[:, 1:]._calculate_summary_statistics())
+
+
+def test_calculate_summary_statistics_dtype(signal):
+    signal.data = signal.data.astype(int)
+    _min, _max = signal._calculate_summary_statistics()[2::4]
+    assert _min.dtype == _max.dtype == signal.data.dtype
+
+
+def test_calculate_summary_statistics_complex(signal):
+    data = signal.data.compute()[:1] + 1j
+    signal.data = da.from_array(data, chunks=2)
+    _mean, _std, _min, *_, _max = signal._calculate_summary_statistics()
+    np.testing.assert_allclose((_mean, _std, _min, _max),
+                               (np.nanmean(data), np.nanstd(data),
+                                np.nanmin(data), np.nanmax(data)))
+
+
+def test_get_navigation_chunk_size(signal):
+    assert signal._get_navigation_chunk_size() == ((2, 1, 3), (4, 5))
+    signal.rechunk(nav_chunks=(3, 9))
+    assert signal._get_navigation_chunk_size() == ((3, 3), (9,))
+    signal.axes_manager[0].navigate = False
+    assert signal._get_navigation_chunk_size() == ((3, 3),)
+
+
+@pytest.mark.parametrize('dtype', ['uint16', 'float16', 'float32', '>f8',
+                                   'complex128'])
+def test_estimate_poissonian_noise_variance(dtype):
+    data = np.arange(60).reshape((3, 4, 5)).astype(dtype)
+    expected = hs.signals.BaseSignal._estimate_poissonian_noise_variance(
+        data, 2, 10, 0.5)
+    variance = _lazy_signals.LazySignal._estimate_poissonian_noise_variance(
+        da.from_array(data, chunks=2), 2, 10, 0.5)
+    assert variance.dtype == expected.dtype
+    np.testing.assert_allclose(variance.compute(), expected)
+
+
+def test_compute_kwargs():
+    sig = _signal()
+    data = sig.data.compute()
+    sig.compute(scheduler="synchronous", optimize_graph=False)
+    assert not sig._lazy
+    np.testing.assert_array_equal(sig.data, data)
+
+
+@pytest.mark.parametrize("store", ["path", "memory"])
+def test_compute_to_zarr(tmp_path, store):
+    zarr = pytest.importorskip("zarr")
+    if store == "path":
+        store = str(tmp_path / "data.zarr")
+    else:
+        store = zarr.storage.MemoryStore()
+    # the chunks of the signal are irregular and are made regular for zarr
+    sig = _signal()
+    data = sig.data.compute()
+    sig.compute(to_zarr=store)
+    assert sig._lazy
+    assert len(sig.data.dask) == sig.data.npartitions + 1
+    np.testing.assert_array_equal(zarr.open(store), data)
+    np.testing.assert_array_equal(sig.data.compute(), data)
@@ -18,6 +18,7 @@
 
 import dask.array as da
 import numpy as np
+import pytest
 
 from hyperspy.signals import Signal1D, Signal2D
 
@@ -87,3 +88,31 @@ def test_lazy_diff_rechunk():
     assert s.diff(axis=-1).data.chunks == ((10,), (99,))
     assert s.diff(axis=-1, rechunk=False).data.chunks == ((1,) *
                                                       10, (1,) * 99)  # The data has not been rechunked
+
+
+def test_lazy_valuemax_valuemin_non_uniform():
+    s = Signal1D(np.random.random((4, 5, 10)))
+    s.axes_manager[-1].convert_to_non_uniform_axis()
+    s.axes_manager[-1].axis = np.arange(10) ** 2.0
+    s.axes_manager[0].scale = 0.3
+    s.axes_manager[0].offset = 3
+    s_lazy = s.as_lazy()
+    for axis in (0, -1):
+        np.testing.assert_allclose(
+            s_lazy.valuemax(axis).data.compute(), s.valuemax(axis).data)
+        np.testing.assert_allclose(
+            s_lazy.valuemin(axis).data.compute(), s.valuemin(axis).data)
+
+
+@pytest.mark.parametrize("size", [10, 11])
+@pytest.mark.parametrize("uniform", [True, False])
+def test_lazy_integrate_simpson(size, uniform):
+    s = Signal1D(np.random.random((4, 5, size)))
+    if not uniform:
+        s.axes_manager[-1].convert_to_non_uniform_axis()
+        s.axes_manager[-1].axis = np.arange(size) ** 1.5
+    s_lazy = s.as_lazy()
+    for axis in (0, -1):
+        np.testing.assert_allclose(
+            s_lazy.integrate_simpson(axis).data.compute(),
+            s.integrate_simpson(axis).data)
@@ -378,6 +378,24 @@ def f(data):
         assert s_out.data.shape[2:] == output_signal_size
         assert s_out.axes_manager.signal_shape == output_signal_size[::-1]
 
+    def test_map_iter_more_signal_dimensions(self):
+        # The iterating signal has more signal dimensions than the signal
+        s = hs.signals.Signal1D(da.ones((4, 3, 5), chunks=(2, 3, 5)))
+        s = s.as_lazy()
+        iter_array = np.arange(4 * 3 * 4).reshape((4, 3, 2, 2))
+        s_iter = hs.signals.Signal2D(iter_array)
+        s_out = s.map(lambda a, b: a.sum() + b.sum(), b=s_iter, inplace=False)
+        np.testing.assert_array_equal(s_out.data,
+                                      5 + iter_array.sum(axis=(2, 3)))
+
+    def test_map_kwargs_map_blocks_names(self):
+        # `name` and `token` are also keyword arguments of `map_blocks`
+        def f(data, name, token):
+            return data + name + token
+
+        s_out = self.s.map(function=f, name=1, token=2, inplace=False)
+        np.testing.assert_array_equal(s_out.data, 3)
+
 
 @pytest.mark.parametrize('ragged', [True, False, None])
 def test_singleton(ragged):